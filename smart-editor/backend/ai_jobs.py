@@ -0,0 +1,308 @@
+"""
+Background AI job queue.
+
+Jobs are persisted in a MongoDB collection and executed by a small pool of
+in-process worker threads, so the HTTP request that submits a job returns
+immediately instead of waiting on the Gemini round trip.
+
+- Fairness: users take turns. Each claim goes to the user who was served
+  least recently (users not served yet go first), and a user can only have
+  MAX_RUNNING_PER_USER jobs running at once in a process. Turn order is
+  tracked per process.
+- `priority` only orders jobs within one user's own queue (higher first,
+  then oldest first); it never lets a user jump ahead of other users.
+- A running job holds a lease, identified by a fresh `lease_id` per claim,
+  that its worker keeps renewing. If the process dies, the lease expires and
+  any worker may pick the job up again. Only the holder of the current lease
+  can finish the job.
+- A job that runs longer than MAX_JOB_SECONDS is marked failed and its
+  worker moves on.
+- Successful results are keyed by a hash of (kind, text) and reused until the
+  job that produced them expires (JOB_TTL_SECONDS after it finished).
+"""
+import hashlib
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import OperationFailure
+
+WORKER_COUNT = int(os.getenv("AI_JOB_WORKERS", "4"))
+MAX_RUNNING_PER_USER = int(os.getenv("AI_JOB_MAX_RUNNING_PER_USER", "1"))
+JOB_TTL_SECONDS = int(os.getenv("AI_JOB_TTL_SECONDS", str(7 * 24 * 3600)))
+MAX_JOB_SECONDS = int(os.getenv("AI_JOB_MAX_SECONDS", "120"))
+LEASE_SECONDS = 60
+POLL_INTERVAL_SECONDS = 2.0
+
+MIN_PRIORITY = 0
+MAX_PRIORITY = 10
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# MongoDB error codes when an index already exists with different options
+INDEX_CONFLICT_CODES = (85, 86)
+
+
+def make_cache_key(kind: str, text: str) -> str:
+    return hashlib.sha256(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def clamp_priority(priority: int) -> int:
+    return max(MIN_PRIORITY, min(MAX_PRIORITY, priority))
+
+
+def serialize_job(job: dict) -> dict:
+    """Convert a job document into a JSON-friendly response."""
+    return {
+        "job_id": str(job["_id"]),
+        "kind": job["kind"],
+        "status": job["status"],
+        "priority": job.get("priority", 0),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "cached": job.get("cached", False),
+        "created_at": job["created_at"].isoformat(),
+        "started_at": job["started_at"].isoformat() if job.get("started_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+    }
+
+
+class JobQueue:
+    def __init__(self, collection, handlers: dict, workers: int = WORKER_COUNT,
+                 ttl_seconds: int = JOB_TTL_SECONDS, max_job_seconds: float = MAX_JOB_SECONDS):
+        """
+        collection: MongoDB collection used to persist jobs
+        handlers:   maps a job kind (e.g. "summarize") to a function text -> result;
+                    raising marks the job as failed
+        """
+        self.collection = collection
+        self.handlers = handlers
+        self.worker_count = workers
+        self.ttl_seconds = ttl_seconds
+        self.max_job_seconds = max_job_seconds
+        # Identifies this process in job documents, for debugging
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+        # Running jobs per user and when each user was last served, in this process
+        self._running = {}
+        self._last_claimed = {}
+        self._running_lock = threading.Lock()
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Create indexes and start the workers."""
+        self.collection.create_index(
+            [("user", ASCENDING), ("status", ASCENDING), ("priority", DESCENDING), ("created_at", ASCENDING)]
+        )
+        self.collection.create_index([("cache_key", ASCENDING), ("status", ASCENDING)])
+        self._ensure_ttl_index()
+
+        self._stop.clear()
+        for i in range(self.worker_count):
+            thread = threading.Thread(target=self._worker_loop, name=f"ai-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _ensure_ttl_index(self):
+        """
+        Finished jobs (and their cached results) are removed by MongoDB after the TTL.
+        If the index already exists with another TTL, update it in place.
+        """
+        try:
+            self.collection.create_index("finished_at", expireAfterSeconds=self.ttl_seconds)
+        except OperationFailure as e:
+            if e.code not in INDEX_CONFLICT_CODES:
+                raise
+            self.collection.database.command(
+                "collMod", self.collection.name,
+                index={"keyPattern": {"finished_at": 1}, "expireAfterSeconds": self.ttl_seconds},
+            )
+
+    def stop(self):
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    # --- Public API ---
+
+    def submit(self, kind: str, text: str, user: str, priority: int = 0) -> dict:
+        """
+        Queue a job and return its document.
+        If the same text has already been processed successfully, a completed job
+        holding the stored result is returned instead, without touching the model.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        cache_key = make_cache_key(kind, text)
+        now = datetime.utcnow()
+        job = {
+            "kind": kind,
+            "user": user,
+            "priority": clamp_priority(priority),
+            "cache_key": cache_key,
+            "created_at": now,
+        }
+
+        # Only jobs that actually ran are cache sources, so a result expires with
+        # the job that produced it no matter how often it is reused
+        previous = self.collection.find_one(
+            {"cache_key": cache_key, "status": STATUS_DONE, "cached": {"$ne": True}},
+            sort=[("finished_at", DESCENDING)],
+        )
+        if previous:
+            job.update({
+                "status": STATUS_DONE,
+                "result": previous["result"],
+                "cached": True,
+                "started_at": now,
+                "finished_at": now,
+            })
+            job["_id"] = self.collection.insert_one(job).inserted_id
+            return job
+
+        job["status"] = STATUS_QUEUED
+        job["text"] = text
+        job["_id"] = self.collection.insert_one(job).inserted_id
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def get(self, job_id) -> dict:
+        return self.collection.find_one({"_id": job_id})
+
+    # --- Workers ---
+
+    def _claim(self):
+        """
+        Atomically move the next eligible job to running and reserve a slot for
+        its user. Eligible means queued, or running under an expired lease.
+        Users are tried in turn, least recently served first, skipping users
+        already at MAX_RUNNING_PER_USER. The lock is held for the whole claim so
+        two threads cannot both take a user's last slot.
+        """
+        now = datetime.utcnow()
+        eligible = {"$or": [
+            {"status": STATUS_QUEUED},
+            {"status": STATUS_RUNNING, "lease_expires_at": {"$lt": now}},
+        ]}
+        with self._running_lock:
+            users = [
+                u for u in self.collection.distinct("user", eligible)
+                if self._running.get(u, 0) < MAX_RUNNING_PER_USER
+            ]
+            users.sort(key=lambda u: (self._last_claimed.get(u, datetime.min), u))
+
+            for user in users:
+                job = self.collection.find_one_and_update(
+                    {**eligible, "user": user},
+                    {"$set": {
+                        "status": STATUS_RUNNING,
+                        "started_at": now,
+                        "worker_id": self.owner_id,
+                        "lease_id": uuid.uuid4().hex,
+                        "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS),
+                    }},
+                    sort=[("priority", DESCENDING), ("created_at", ASCENDING)],
+                    return_document=ReturnDocument.AFTER,
+                )
+                # None means another process took this user's last job first
+                if job:
+                    self._running[user] = self._running.get(user, 0) + 1
+                    self._last_claimed[user] = now
+                    return job
+        return None
+
+    def _release(self, user: str):
+        with self._running_lock:
+            self._running[user] -= 1
+            if self._running[user] <= 0:
+                del self._running[user]
+        # A slot for this user opened up; let an idle worker re-check the queue
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _renew_lease(self, job: dict, done: threading.Event):
+        while not done.wait(LEASE_SECONDS / 3):
+            try:
+                self.collection.update_one(
+                    {"_id": job["_id"], "lease_id": job["lease_id"], "status": STATUS_RUNNING},
+                    {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}},
+                )
+            except Exception as e:
+                print(f"AI job {job['_id']} lease renewal failed: {str(e)}")
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"AI job claim failed: {str(e)}")
+                job = None
+
+            if not job:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=POLL_INTERVAL_SECONDS)
+                continue
+
+            try:
+                self._run(job)
+            except Exception as e:
+                # The lease will expire and another worker will retry the job
+                print(f"AI job {job['_id']} could not be saved: {str(e)}")
+            finally:
+                self._release(job["user"])
+
+    def _call_handler(self, job: dict) -> dict:
+        """
+        Run the handler in its own thread and wait at most max_job_seconds.
+        A handler that overruns is abandoned: its result is discarded and the
+        worker is free for the next job.
+        """
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = self.handlers[job["kind"]](job["text"])
+            except Exception as e:
+                outcome["error"] = e
+
+        handler_thread = threading.Thread(target=target, name=f"ai-job-{job['_id']}", daemon=True)
+        handler_thread.start()
+        handler_thread.join(self.max_job_seconds)
+
+        if handler_thread.is_alive():
+            print(f"AI job {job['_id']} timed out after {self.max_job_seconds}s")
+            return {"status": STATUS_FAILED, "error": f"Timed out after {self.max_job_seconds} seconds"}
+        if "error" in outcome:
+            print(f"AI job {job['_id']} failed: {str(outcome['error'])}")
+            return {"status": STATUS_FAILED, "error": str(outcome["error"])}
+        return {"status": STATUS_DONE, "result": outcome["result"]}
+
+    def _run(self, job: dict):
+        done = threading.Event()
+        renewer = threading.Thread(target=self._renew_lease, args=(job, done), daemon=True)
+        renewer.start()
+        try:
+            update = self._call_handler(job)
+        finally:
+            done.set()
+
+        update["finished_at"] = datetime.utcnow()
+        # Only the current lease holder may finish the job; the input text is dropped
+        self.collection.update_one(
+            {"_id": job["_id"], "lease_id": job["lease_id"]},
+            {"$set": update, "$unset": {"text": "", "lease_expires_at": ""}},
+        )
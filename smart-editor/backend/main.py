@@ -23,3 +23,12 @@ app.include_router(posts.router)
 app.include_router(drafts.router)
 app.include_router(ai.router)
 
+
+@app.on_event("startup")
+def start_ai_workers():
+    ai.job_queue.start()
+
+
+@app.on_event("shutdown")
+def stop_ai_workers():
+    ai.job_queue.stop()
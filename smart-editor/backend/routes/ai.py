@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from database import db
+from ai_jobs import JobQueue, serialize_job, clamp_priority, MAX_JOB_SECONDS, STATUS_DONE, STATUS_FAILED
+from routes.auth import get_current_user
+from bson import ObjectId
+from bson.errors import InvalidId
+import asyncio
+import json
 import os
 import re
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,8 +26,11 @@ MODELS_TO_TRY = [
 ]
 
 
-def call_gemini(prompt: str) -> str:
-    """Helper to call Gemini API using the google-generativeai SDK."""
+def call_gemini(prompt: str, timeout: float = None) -> str:
+    """
+    Helper to call Gemini API using the google-generativeai SDK.
+    `timeout` is the total time budget in seconds, shared across the model fallbacks.
+    """
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=500, detail="Gemini API Key missing in server environment")
 
@@ -26,11 +38,19 @@ def call_gemini(prompt: str) -> str:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
 
+        deadline = time.monotonic() + timeout if timeout else None
         last_error = None
         for model_name in MODELS_TO_TRY:
+            request_options = {}
+            if deadline:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    last_error = TimeoutError(f"No response within {timeout} seconds")
+                    break
+                request_options["timeout"] = remaining
             try:
                 model = genai.GenerativeModel(model_name)
-                response = model.generate_content(prompt)
+                response = model.generate_content(prompt, request_options=request_options)
                 if response and response.text:
                     return response.text
             except Exception as e:
@@ -162,6 +182,60 @@ def local_fix_grammar(text: str) -> str:
     return fixed
 
 
+def summarize_prompt(text: str) -> str:
+    return f"Summarize the following blog content professionally. Keep it concise and well-structured:\n\n{text}"
+
+
+def fix_grammar_prompt(text: str) -> str:
+    return (
+        "Fix the grammar, spelling, and punctuation in the following text. "
+        "Improve clarity and readability while keeping the original meaning and tone. "
+        "Return ONLY the corrected text without any explanations or notes:\n\n"
+        f"{text}"
+    )
+
+
+def summarize_text(text: str) -> str:
+    """Summarize with Gemini, falling back to the local summarizer."""
+    try:
+        return call_gemini(summarize_prompt(text))
+    except Exception as e:
+        print(f"AI Summary failed, using local fallback: {str(e)}")
+        return local_summarize(text)
+
+
+def fix_grammar_text(text: str) -> str:
+    """Fix grammar with Gemini, falling back to the local fixer."""
+    try:
+        return call_gemini(fix_grammar_prompt(text))
+    except Exception as e:
+        print(f"AI Grammar fix failed, using local fallback: {str(e)}")
+        return local_fix_grammar(text)
+
+
+# Job handlers use Gemini only: a Gemini error marks the job failed, so the
+# local fallback output is never stored and reused as a cached result.
+# Their Gemini calls share the job's time limit.
+# Started and stopped by main.py on application startup/shutdown
+job_queue = JobQueue(db.ai_jobs, {
+    "summarize": lambda text: call_gemini(summarize_prompt(text), timeout=MAX_JOB_SECONDS),
+    "fix-grammar": lambda text: call_gemini(fix_grammar_prompt(text), timeout=MAX_JOB_SECONDS),
+})
+
+
+def find_job(job_id: str, user: str) -> dict:
+    try:
+        oid = ObjectId(job_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+
+    job = job_queue.get(oid)
+
+    if not job or job["user"] != user:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
 @router.post("/generate")
 async def generate_summary(body: dict):
     """Generate a professional summary of the blog content."""
@@ -169,15 +243,7 @@ async def generate_summary(body: dict):
     if not text:
         raise HTTPException(status_code=400, detail="No content provided for AI")
 
-    prompt = f"Summarize the following blog content professionally. Keep it concise and well-structured:\n\n{text}"
-
-    try:
-        result = call_gemini(prompt)
-        return {"result": result}
-    except Exception as e:
-        print(f"AI Summary failed, using local fallback: {str(e)}")
-        result = local_summarize(text)
-        return {"result": result}
+    return {"result": summarize_text(text)}
 
 
 @router.post("/fix-grammar")
@@ -187,17 +253,61 @@ async def fix_grammar(body: dict):
     if not text:
         raise HTTPException(status_code=400, detail="No content provided for AI")
 
-    prompt = (
-        "Fix the grammar, spelling, and punctuation in the following text. "
-        "Improve clarity and readability while keeping the original meaning and tone. "
-        "Return ONLY the corrected text without any explanations or notes:\n\n"
-        f"{text}"
-    )
+    return {"result": fix_grammar_text(text)}
+
+
+@router.post("/jobs")
+def submit_job(body: dict, current_user: dict = Depends(get_current_user)):
+    """
+    Queue a summarize or fix-grammar request and return its job ID immediately.
+    Body: {"kind": "summarize" | "fix-grammar", "text": "...", "priority": 0}
+    Priority is clamped to 0-10 and only orders the caller's own jobs;
+    users take turns regardless of priority.
+    Poll GET /api/ai/jobs/{job_id} or subscribe to /api/ai/jobs/{job_id}/events.
+    """
+    kind = body.get("kind")
+    text = body.get("text")
+    if kind not in job_queue.handlers:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind: {kind}")
+    if not text:
+        raise HTTPException(status_code=400, detail="No content provided for AI")
 
     try:
-        result = call_gemini(prompt)
-        return {"result": result}
-    except Exception as e:
-        print(f"AI Grammar fix failed, using local fallback: {str(e)}")
-        result = local_fix_grammar(text)
-        return {"result": result}
\ No newline at end of file
+        priority = clamp_priority(int(body.get("priority", 0)))
+    except (TypeError, ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail="Priority must be an integer")
+
+    job = job_queue.submit(kind, text, current_user["email"], priority)
+    return serialize_job(job)
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll a job's status; `result` is set once status is "done"."""
+    return serialize_job(find_job(job_id, current_user["email"]))
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events stream that emits the job on every status change until it finishes.
+    A heartbeat comment is sent every second so proxies do not close an idle connection.
+    """
+    await asyncio.to_thread(find_job, job_id, current_user["email"])
+
+    async def stream():
+        last_status = None
+        while True:
+            job = await asyncio.to_thread(job_queue.get, ObjectId(job_id))
+            if not job:
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"data: {json.dumps(serialize_job(job))}\n\n"
+            else:
+                yield ": ping\n\n"
+            if job["status"] in (STATUS_DONE, STATUS_FAILED):
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
@@ -0,0 +1,315 @@
+"""
+Unit tests for the background AI job queue.
+Runs without MongoDB or Gemini: JobQueue gets an in-memory collection and stub handlers.
+
+    pip install -r requirements-dev.txt
+    python -m pytest test_ai_jobs.py
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+# routes.ai creates the real client on import; keep it from resolving the .env cluster
+os.environ["MONGODB_URL"] = "mongodb://localhost:27017"
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import OperationFailure
+
+import ai_jobs
+from ai_jobs import JobQueue
+
+
+class FakeDatabase:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def command(self, name, collection_name, index):
+        assert name == "collMod" and collection_name == self.collection.name
+        self.collection.ttl_indexes[list(index["keyPattern"])[0]] = index["expireAfterSeconds"]
+
+
+class FakeCollection:
+    """Minimal stand-in for the pymongo collection methods JobQueue uses."""
+
+    name = "ai_jobs"
+
+    def __init__(self):
+        self.docs = []
+        self.fail_updates = False
+        self.ttl_indexes = {}
+        self.database = FakeDatabase(self)
+
+    def create_index(self, keys, **kwargs):
+        if "expireAfterSeconds" not in kwargs:
+            return
+        existing = self.ttl_indexes.get(keys)
+        if existing is not None and existing != kwargs["expireAfterSeconds"]:
+            raise OperationFailure("An equivalent index already exists with different options", code=85)
+        self.ttl_indexes[keys] = kwargs["expireAfterSeconds"]
+
+    def _matches(self, doc, query):
+        for key, cond in query.items():
+            if key == "$or":
+                if not any(self._matches(doc, q) for q in cond):
+                    return False
+            elif isinstance(cond, dict):
+                value = doc.get(key)
+                if "$ne" in cond and value == cond["$ne"]:
+                    return False
+                if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                    return False
+            elif doc.get(key) != cond:
+                return False
+        return True
+
+    def _find(self, query, sort=None):
+        docs = [d for d in self.docs if self._matches(d, query)]
+        for key, direction in reversed(sort or []):
+            docs.sort(key=lambda d: d.get(key), reverse=direction < 0)
+        return docs
+
+    def _apply(self, doc, update):
+        doc.update(update.get("$set", {}))
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+
+    def distinct(self, key, query):
+        return sorted({d.get(key) for d in self._find(query)})
+
+    def find_one(self, query, sort=None):
+        docs = self._find(query, sort)
+        return dict(docs[0]) if docs else None
+
+    def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(dict(doc))
+
+        class Result:
+            inserted_id = doc["_id"]
+        return Result()
+
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        docs = self._find(query, sort)
+        if not docs:
+            return None
+        self._apply(docs[0], update)
+        return dict(docs[0])
+
+    def update_one(self, query, update):
+        if self.fail_updates:
+            raise RuntimeError("database unavailable")
+        docs = self._find(query)
+        if docs:
+            self._apply(docs[0], update)
+
+
+def make_queue(handlers=None, workers=0, **kwargs):
+    calls = []
+
+    def echo(text):
+        calls.append(text)
+        return text.upper()
+
+    queue = JobQueue(FakeCollection(), handlers or {"summarize": echo}, workers=workers, **kwargs)
+    return queue, calls
+
+
+def run_next(queue):
+    job = queue._claim()
+    queue._run(job)
+    queue._release(job["user"])
+    return queue.get(job["_id"])
+
+
+def test_priority_orders_a_users_own_jobs():
+    queue, _ = make_queue()
+    queue.submit("summarize", "low", "alice@example.com", priority=0)
+    queue.submit("summarize", "high", "alice@example.com", priority=5)
+
+    assert queue._claim()["priority"] == 5
+
+
+def test_users_take_turns_regardless_of_priority(monkeypatch):
+    monkeypatch.setattr(ai_jobs, "MAX_RUNNING_PER_USER", 10)
+    queue, _ = make_queue()
+    for i in range(3):
+        queue.submit("summarize", f"a{i}", "alice@example.com", priority=10)
+    queue.submit("summarize", "b0", "bob@example.com", priority=0)
+
+    claimed = [queue._claim()["user"] for _ in range(4)]
+    assert claimed[:2] == ["alice@example.com", "bob@example.com"]
+
+
+def test_priority_is_clamped():
+    queue, _ = make_queue()
+    job = queue.submit("summarize", "text", "alice@example.com", priority=10 ** 30)
+
+    assert job["priority"] == ai_jobs.MAX_PRIORITY
+
+
+def test_running_jobs_are_capped_per_user(monkeypatch):
+    monkeypatch.setattr(ai_jobs, "MAX_RUNNING_PER_USER", 1)
+    queue, _ = make_queue()
+    queue.submit("summarize", "a1", "alice@example.com")
+    queue.submit("summarize", "a2", "alice@example.com")
+    queue.submit("summarize", "b1", "bob@example.com")
+
+    assert queue._claim()["user"] == "alice@example.com"
+    assert queue._claim()["user"] == "bob@example.com"
+    assert queue._claim() is None
+
+    queue._release("alice@example.com")
+    assert queue._claim()["user"] == "alice@example.com"
+
+
+def test_finished_result_is_reused_without_text():
+    queue, calls = make_queue()
+    queue.submit("summarize", "hello", "alice@example.com")
+    finished = run_next(queue)
+
+    assert finished["status"] == ai_jobs.STATUS_DONE
+    assert finished["result"] == "HELLO"
+    assert "text" not in finished
+
+    cached = queue.submit("summarize", "hello", "bob@example.com")
+    assert cached["status"] == ai_jobs.STATUS_DONE
+    assert cached["cached"] is True
+    assert cached["result"] == "HELLO"
+    assert "text" not in cached
+    assert calls == ["hello"]
+
+
+def test_failed_job_is_not_reused():
+    def broken(text):
+        raise RuntimeError("AI service unavailable")
+
+    queue, _ = make_queue({"summarize": broken})
+    queue.submit("summarize", "hello", "alice@example.com")
+    finished = run_next(queue)
+
+    assert finished["status"] == ai_jobs.STATUS_FAILED
+    assert finished["error"] == "AI service unavailable"
+    assert queue.submit("summarize", "hello", "alice@example.com")["status"] == ai_jobs.STATUS_QUEUED
+
+
+def test_only_expired_leases_are_reclaimed():
+    queue, _ = make_queue()
+    now = datetime.utcnow()
+    for text, lease in (("live", now + timedelta(seconds=30)), ("dead", now - timedelta(seconds=1))):
+        queue.collection.insert_one({
+            "kind": "summarize", "text": text, "user": f"{text}@example.com", "priority": 0,
+            "status": ai_jobs.STATUS_RUNNING, "created_at": now,
+            "worker_id": "other-process", "lease_expires_at": lease,
+        })
+
+    job = queue._claim()
+    assert job["text"] == "dead"
+    assert job["worker_id"] == queue.owner_id
+    assert queue._claim() is None
+
+
+def test_stale_claim_in_same_process_cannot_finish_job(monkeypatch):
+    monkeypatch.setattr(ai_jobs, "MAX_RUNNING_PER_USER", 10)
+    queue, _ = make_queue()
+    job = queue.submit("summarize", "hello", "alice@example.com")
+    stale = queue._claim()
+    queue.collection.update_one(
+        {"_id": job["_id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+    current = queue._claim()
+    assert current["lease_id"] != stale["lease_id"]
+
+    queue._run(stale)
+    assert queue.get(job["_id"])["status"] == ai_jobs.STATUS_RUNNING
+
+    queue._run(current)
+    assert queue.get(job["_id"])["status"] == ai_jobs.STATUS_DONE
+
+
+def test_job_over_time_limit_fails():
+    release = threading.Event()
+
+    def hang(text):
+        release.wait(5)
+        return text
+
+    queue, _ = make_queue({"summarize": hang}, max_job_seconds=0.1)
+    queue.submit("summarize", "hello", "alice@example.com")
+    try:
+        finished = run_next(queue)
+    finally:
+        release.set()
+
+    assert finished["status"] == ai_jobs.STATUS_FAILED
+    assert "Timed out" in finished["error"]
+    assert "lease_expires_at" not in finished
+
+
+def test_cached_copies_do_not_extend_result_lifetime():
+    queue, calls = make_queue()
+    original = queue.submit("summarize", "hello", "alice@example.com")
+    run_next(queue)
+    assert queue.submit("summarize", "hello", "bob@example.com")["cached"] is True
+
+    # The TTL index removes the job that produced the result
+    queue.collection.docs = [d for d in queue.collection.docs if d["_id"] != original["_id"]]
+
+    assert queue.submit("summarize", "hello", "carol@example.com")["status"] == ai_jobs.STATUS_QUEUED
+
+
+def test_restart_with_new_ttl_updates_index():
+    queue, _ = make_queue(ttl_seconds=3600)
+    queue.start()
+    queue.stop()
+
+    restarted = JobQueue(queue.collection, queue.handlers, workers=0, ttl_seconds=60)
+    restarted.start()
+    restarted.stop()
+
+    assert queue.collection.ttl_indexes["finished_at"] == 60
+
+
+def test_worker_survives_database_errors():
+    started = threading.Event()
+
+    def slow(text):
+        started.set()
+        return text
+
+    queue, _ = make_queue({"summarize": slow}, workers=1)
+    queue.start()
+    try:
+        queue.collection.fail_updates = True
+        queue.submit("summarize", "first", "alice@example.com")
+        assert started.wait(2)
+        time.sleep(0.1)
+        assert queue._threads[0].is_alive()
+
+        queue.collection.fail_updates = False
+        second = queue.submit("summarize", "second", "alice@example.com")
+        for _ in range(50):
+            if queue.get(second["_id"])["status"] == ai_jobs.STATUS_DONE:
+                break
+            time.sleep(0.1)
+        assert queue.get(second["_id"])["status"] == ai_jobs.STATUS_DONE
+    finally:
+        queue.stop()
+
+
+def test_job_is_hidden_from_other_users(monkeypatch):
+    from routes import ai
+
+    queue, _ = make_queue()
+    monkeypatch.setattr(ai, "job_queue", queue)
+    job = queue.submit("summarize", "hello", "alice@example.com")
+
+    assert ai.find_job(str(job["_id"]), "alice@example.com")["_id"] == job["_id"]
+    with pytest.raises(HTTPException) as exc:
+        ai.find_job(str(job["_id"]), "bob@example.com")
+    assert exc.value.status_code == 404
+    with pytest.raises(HTTPException) as exc:
+        ai.find_job("not-an-id", "alice@example.com")
+    assert exc.value.status_code == 400
@@ -3,6 +3,7 @@ import sys
 import os
 import random
 import string
+import time
 
 BASE_URL = "http://localhost:8000/api"
 
@@ -100,6 +101,31 @@ def run_tests():
     else:
         print(f"⚠️ AI Grammar returned {res.status_code}: {res.text}")
 
+    # 8. AI Job Queue
+    print("8. Testing AI Job Queue...")
+    res = requests.post(f"{BASE_URL}/ai/jobs", json={
+        "kind": "summarize",
+        "text": "This is a long enough text to test the background summary job of the application."
+    }, headers=headers)
+    if res.status_code != 200:
+        print(f"❌ Job submit failed: {res.text}")
+        sys.exit(1)
+    job_id = res.json()["job_id"]
+
+    for _ in range(60):
+        res = requests.get(f"{BASE_URL}/ai/jobs/{job_id}", headers=headers)
+        if res.status_code != 200:
+            print(f"❌ Job poll failed: {res.text}")
+            sys.exit(1)
+        if res.json()["status"] in ("done", "failed"):
+            break
+        time.sleep(1)
+
+    if res.json()["status"] == "done":
+        print(f"✅ AI Job finished (ID: {job_id})")
+    else:
+        print(f"⚠️ AI Job ended with status {res.json()['status']}: {res.json()['error']}")
+
     print("\n🎉 ALL CRITICAL PATHS PASSED!")
 
 if __name__ == "__main__":